@@ -1,20 +1,339 @@
+import asyncio
+import functools
+import hashlib
+import itertools
+import json
+import logging
 import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
 from dotenv import load_dotenv
 from shiny import App, render, ui, reactive
-from huggingface_hub import InferenceClient
-from datetime import datetime
+from huggingface_hub import AsyncInferenceClient
 import google.generativeai as genai
 
+# Windows consoles default to cp1252, where non-ASCII output raises
+# UnicodeEncodeError per write; force a tolerant UTF-8 stdout instead
+if hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+# orjson serializes small dicts several times faster than the stdlib json;
+# fall back to json when it is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The semantic cache needs sentence-transformers + numpy; degrade gracefully without them
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+    SEMANTIC_CACHE_AVAILABLE = True
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
+
+# The embedding model is loaded once at import, next to the lingua detector
+# build below: instantiating it lazily on the first cache lookup would stall
+# the first real question behind the load (minutes on a cold HF hub cache)
+# while the reactive lock is held.
+embedding_model = None
+if SEMANTIC_CACHE_AVAILABLE:
+    try:
+        logger.info("[RUN] Loading sentence-transformers model for the semantic cache...")
+        embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+        logger.info("[OK] Embedding model loaded")
+    except Exception as e:
+        logger.error(f"[ERR] Failed to load the embedding model, semantic cache disabled: {e!r}")
+        SEMANTIC_CACHE_AVAILABLE = False
+
+# Local language detector (sub-millisecond, no network); Gemini stays as fallback
+try:
+    from lingua import Language, LanguageDetectorBuilder
+    language_detector = LanguageDetectorBuilder.from_languages(
+        Language.ENGLISH,
+        Language.INDONESIAN,
+        Language.MALAY,
+        Language.SPANISH,
+        Language.FRENCH,
+        Language.GERMAN,
+        Language.DUTCH,
+        Language.ARABIC,
+        Language.CHINESE,
+        Language.JAPANESE,
+    ).build()
+except ImportError:
+    language_detector = None
+
+# Below this confidence the local detector is not trusted; the sticky session
+# language or the auto-detecting translation prompt covers those cases
+LOCAL_DETECT_CONFIDENCE = 0.7
+
+
+def local_language_of(text: str):
+    """Return the confidently detected language name of `text`, or None."""
+    if language_detector is None:
+        return None
+    confidences = language_detector.compute_language_confidence_values(text)
+    if confidences and confidences[0].value >= LOCAL_DETECT_CONFIDENCE:
+        return confidences[0].language.name.title()
+    return None
+
 # Load environment variables from .env file
 load_dotenv()
 
+# System prompt for the medical model, shared by the API call and the cache key
+SYSTEM_PROMPT = "You are Dokter Arki, a helpful medical AI assistant. Provide accurate, educational information. Structure your answer for clarity and readability. Use markdown formatting such as bullet points (`* item`), numbered lists, and bold text (`**text**`) where it helps to explain complex information. Always conclude your response by reminding the user to consult a qualified healthcare professional for any medical advice, diagnosis, or treatment."
+
+# Prebuilt message pieces so the hot path only allocates the per-turn parts
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Primer for the persistent Gemini chat used for translation; keeping the
+# instruction as a stable prefix lets Gemini's implicit prompt caching kick in
+TRANSLATE_PRIMER = "You are a translation engine. For each following message, translate the given text exactly as instructed, preserving markdown formatting. Reply with only the translation, nothing else."
+TRANSLATE_PROMPT_FMT = "Translate the following text to {target}. Only provide the translation, nothing else:\n\n{text}"
+MATCH_PROMPT_FMT = (
+    "The following is a user's message in their native language:\n"
+    "<USER>{sample}</USER>\n"
+    "Translate the AI response below into that same language. If the response "
+    "is already in that language, return it unchanged. Output only the "
+    "translation, nothing else.\n"
+    "<RESPONSE>{text}</RESPONSE>"
+)
+
+
+class ResponseCache:
+    """Small in-process LRU cache with TTL for fully translated AI responses."""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600.0):
+        self._entries = OrderedDict()
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at > self._ttl:
+            del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return value
+
+    def set(self, key: str, value) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+
+# Process-wide cache so identical questions skip the HF + Gemini round-trips
+response_cache = ResponseCache()
+
+# Detection results for recently seen inputs, keyed by a normalized fingerprint
+detect_cache = ResponseCache(maxsize=256, ttl=86400.0)
+
+
+def detect_cache_key(text: str) -> str:
+    return text.strip().lower()[:200]
+
+
+class SemanticCache:
+    """Embedding-similarity cache that catches paraphrased repeats of past questions.
+
+    Questions are embedded with a small local model (~5ms on CPU) and matched by
+    cosine similarity against previously answered ones, so a paraphrase like
+    "tanda-tanda diabetes apa saja?" can reuse the answer generated for
+    "apa gejala diabetes?" without a multi-second HF generation. To avoid false
+    hits on context-dependent follow-ups, the previous user turn is embedded too
+    and must also match before a cached answer is returned.
+    """
+
+    def __init__(self, threshold: float = 0.92, maxsize: int = 512):
+        self._threshold = threshold
+        self._maxsize = maxsize
+        self._embeddings = None  # N x 384 matrix of normalized question embeddings
+        self._entries = []  # parallel list of (response, lang, prev_embedding)
+
+    def _encode(self, text: str):
+        return embedding_model.encode(text, normalize_embeddings=True)
+
+    def lookup(self, user_message: str, prev_message: str = None):
+        """Return the cached (response, lang) for a similar past question, or None."""
+        if not SEMANTIC_CACHE_AVAILABLE or self._embeddings is None:
+            return None
+        query = self._encode(user_message)
+        sims = self._embeddings @ query
+        best = int(sims.argmax())
+        if sims[best] <= self._threshold:
+            return None
+        response, lang, prev_embedding = self._entries[best]
+        # Guard contextual queries: if this turn has conversational context, the
+        # previous turn must be similar too, otherwise treat it as a miss.
+        if prev_message is not None:
+            if prev_embedding is None:
+                return None
+            prev_sim = float(prev_embedding @ self._encode(prev_message))
+            if prev_sim <= self._threshold:
+                return None
+        elif prev_embedding is not None:
+            return None
+        return response, lang
+
+    def add(self, user_message: str, response: str, lang: str, prev_message: str = None) -> None:
+        if not SEMANTIC_CACHE_AVAILABLE:
+            return
+        embedding = self._encode(user_message)
+        prev_embedding = self._encode(prev_message) if prev_message is not None else None
+        if self._embeddings is None:
+            self._embeddings = embedding[np.newaxis, :]
+        else:
+            self._embeddings = np.vstack([self._embeddings, embedding])
+        self._entries.append((response, lang, prev_embedding))
+        if len(self._entries) > self._maxsize:
+            self._embeddings = self._embeddings[1:]
+            self._entries.pop(0)
+
+
+semantic_cache = SemanticCache()
+
+
+def response_cache_key(user_message: str, context: tuple = (), lang=None) -> str:
+    """Build a stable cache key covering the message, context, language and system prompt."""
+    payload = {"msg": user_message, "sys": SYSTEM_PROMPT, "ctx": list(context), "lang": lang}
+    if orjson is not None:
+        raw = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    else:
+        raw = json.dumps(payload, sort_keys=True).encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+# The medical model served through the HF Inference API
+HF_MODEL = "Intelligent-Internet/II-Medical-8B-1706"
+
+# Message timestamp format, compiled into one strftime call on the C level
+TS_FMT = "%H:%M:%S"
+
+# Trivial greetings get a canned reply: language detection is unreliable on
+# one-word inputs and a full HF + Gemini pipeline run would be wasted on them
+GREETING_RE = re.compile(r"^(hi|halo|hello|hai|hey|thanks|thank you|terima kasih|makasih)\b")
+CANNED_GREETING = (
+    "Halo! 👋 Silakan ajukan pertanyaan medis Anda atau jelaskan gejala yang Anda alami. "
+    "Hello! Feel free to ask me any medical question or describe your symptoms."
+)
+
+# Keep at most this many messages in memory so per-turn copy/render cost stays
+# bounded no matter how long a conversation runs
+MAX_HISTORY_MESSAGES = 50
+
+# Conversation context sent to the medical model: the last few messages are
+# included verbatim, everything older is folded into a rolling summary that is
+# refreshed in the background every SUMMARY_PERIOD messages. Tokens per request
+# stay O(context + summary) instead of O(conversation).
+HISTORY_CONTEXT_TURNS = 6
+SUMMARY_PERIOD = 4
+SUMMARY_PROMPT_FMT = "Summarize the key medical facts, symptoms and questions from this conversation in at most 120 words, in English:\n\n{transcript}"
+
+# Push streamed partial responses to the client at most this often (seconds);
+# per-token pushes would flood the websocket without looking any smoother
+STREAM_UPDATE_INTERVAL = 0.2
+
+# Micro-batching: completions arriving within this window are dispatched together
+BATCH_SIZE = 8
+BATCH_WINDOW_MS = 75
+
+
+class CompletionBatcher:
+    """Micro-batches concurrent chat completions over the shared HF client.
+
+    Under load, sessions sending messages within a short window are drained
+    together (up to BATCH_SIZE or after BATCH_WINDOW_MS) and dispatched as one
+    asyncio.gather over the persistent AsyncInferenceClient, instead of N
+    independent request storms. Each caller awaits its own future and still
+    receives streamed deltas via its callback.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, window_ms: int = BATCH_WINDOW_MS):
+        self._batch_size = batch_size
+        self._window = window_ms / 1000.0
+        self._queue = asyncio.Queue()
+        self._worker = None
+        self._in_flight = set()
+
+    async def submit(self, client, messages, on_delta=None, **create_kwargs) -> str:
+        """Queue one completion and await its full response text."""
+        # The worker is started lazily because there is no event loop at import time
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((client, messages, on_delta, create_kwargs, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # A lone request is dispatched immediately: holding it for the
+            # window would add BATCH_WINDOW_MS to every message even when no
+            # other session is sending. The window only opens once a second
+            # request is already queued behind the first.
+            if not self._queue.empty():
+                deadline = loop.time() + self._window
+                while len(batch) < self._batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            if len(batch) > 1:
+                logger.info(f"[BATCH] Dispatching batch of {len(batch)} completions")
+            # Fire and keep collecting: awaiting the generations here would hold
+            # up the drain loop for the full batch's streaming time and serialize
+            # every later arrival behind it.
+            for request in batch:
+                task = asyncio.create_task(self._run_one(*request))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+
+    async def _run_one(self, client, messages, on_delta, create_kwargs, future):
+        try:
+            completion = await client.chat.completions.create(
+                model=HF_MODEL, messages=messages, stream=True, **create_kwargs
+            )
+            chunks = []
+            async for chunk in completion:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    if on_delta is not None:
+                        await on_delta("".join(chunks))
+            future.set_result("".join(chunks))
+        except Exception as e:
+            future.set_exception(e)
+
+
+completion_batcher = CompletionBatcher()
+
 # Initialize the Hugging Face AI client
 def initialize_hf_client():
     api_key = os.getenv("HF_TOKEN")
     if not api_key:
         raise ValueError("API key not found. Please set HF_TOKEN in your .env file or environment variables.")
     
-    return InferenceClient(
+    # A single client instance keeps its aiohttp session (and therefore the
+    # TCP/TLS connections) alive across calls, so handshakes are not repeated.
+    return AsyncInferenceClient(
         provider="auto",
         api_key=api_key,
     )
@@ -24,606 +343,85 @@ def initialize_google_client():
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise ValueError("Google API key not found. Please set GOOGLE_API_KEY in your .env file.")
-    genai.configure(api_key=api_key)
+    # REST transport reuses one persistent HTTP session instead of setting up a
+    # channel per call, which avoids repeated handshake latency under load.
+    genai.configure(api_key=api_key, transport="rest")
     # Using a fast and efficient model for the translation task
     return genai.GenerativeModel('gemini-1.5-flash-latest')
 
-# UI Definition
-app_ui = ui.page_fluid(
-    # Link to external CSS and JS files in the 'www' directory
-    # CSS and JS are now incorporated directly into the app
-    ui.tags.head(
-        ui.tags.style("""
-            /* Medical App Professional Styling */
-            :root {
-                --primary-color: #2563eb;
-                --primary-dark: #1d4ed8;
-                --secondary-color: #f8fafc;
-                --accent-color: #10b981;
-                --warning-color: #f59e0b;
-                --danger-color: #ef4444;
-                --text-primary: #1f2937;
-                --text-secondary: #6b7280;
-                --text-muted: #9ca3af;
-                --border-color: #e5e7eb;
-                --shadow-sm: 0 1px 2px 0 rgba(0, 0, 0, 0.05);
-                --shadow-md: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);
-                --shadow-lg: 0 10px 15px -3px rgba(0, 0, 0, 0.1), 0 4px 6px -2px rgba(0, 0, 0, 0.05);
-                --radius-sm: 0.375rem;
-                --radius-md: 0.5rem;
-                --radius-lg: 0.75rem;
-            }
-
-            * {
-                box-sizing: border-box;
-            }
-
-            body {
-                font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
-                background-color: #f4f7f9; /* Softer, more professional background */
-                min-height: 100vh;
-                margin: 0;
-                padding: 0;
-                color: var(--text-primary);
-                line-height: 1.6;
-            }
-
-            .main-container {
-                max-width: 1280px; /* Widen container for two-column layout */
-                margin: 2rem auto;
-                padding: 2rem;
-                background: #ffffff; /* Cleaner solid white background */
-                border-radius: var(--radius-lg);
-                box-shadow: 0 10px 30px -15px rgba(0, 0, 0, 0.1); /* Softer, more subtle shadow */
-            }
-
-            .app-header {
-                text-align: center;
-                margin-bottom: 2rem;
-                padding-bottom: 1.5rem;
-                border-bottom: 2px solid var(--border-color);
-            }
-
-            .app-title {
-                font-size: 2.5rem;
-                font-weight: 700;
-                color: var(--primary-color);
-                margin: 0;
-                text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.1);
-            }
-
-            .app-subtitle {
-                font-size: 1.2rem;
-                color: var(--text-secondary);
-                margin: 0.5rem 0 0 0;
-                font-weight: 400;
-            }
-
-            .warning-box {
-                background: linear-gradient(135deg, #fff3cd 0%, #fef3c7 100%);
-                border: 1px solid #fbbf24;
-                border-radius: var(--radius-md);
-                padding: 1.5rem;
-                margin-bottom: 2rem;
-                color: #92400e;
-                box-shadow: var(--shadow-sm);
-            }
-
-            .warning-box h5 {
-                margin: 0 0 0.75rem 0;
-                font-size: 1.1rem;
-                font-weight: 600;
-                color: #d97706;
-            }
-
-            .warning-box p {
-                margin: 0;
-                font-size: 0.95rem;
-                line-height: 1.5;
-            }
-
-            .warning-box hr {
-                border: none;
-                height: 1px;
-                background-color: rgba(146, 64, 14, 0.2); /* A semi-transparent version of the text color */
-                margin: 1rem 0;
-            }
-
-            .warning-box a {
-                color: #b45309; /* A darker shade of the warning text color */
-                font-weight: 600;
-                text-decoration: none;
-            }
-            
-            .warning-box a:hover {
-                text-decoration: underline;
-            }
-
-
-            .chat-container {
-                max-height: 600px;
-                overflow-y: auto;
-                border: 2px solid var(--border-color);
-                border-radius: var(--radius-lg);
-                padding: 1.5rem;
-                background: var(--secondary-color);
-                margin-bottom: 2rem;
-                box-shadow: inset 0 2px 4px rgba(0, 0, 0, 0.06);
-                position: relative;
-            }
-
-            .chat-container::-webkit-scrollbar {
-                width: 8px;
-            }
-
-            .chat-container::-webkit-scrollbar-track {
-                background: #f1f5f9;
-                border-radius: 4px;
-            }
-
-            .chat-container::-webkit-scrollbar-thumb {
-                background: #cbd5e1;
-                border-radius: 4px;
-            }
-
-            .chat-container::-webkit-scrollbar-thumb:hover {
-                background: #94a3b8;
-            }
-
-            .chat-welcome {
-                text-align: center;
-                padding: 1rem 0.5rem;
-                color: var(--text-secondary);
-            }
-
-            .chat-welcome-icon {
-                font-size: 3rem;
-                margin-bottom: 1rem;
-                display: block;
-            }
-
-            .chat-welcome-text {
-                font-size: 1.1rem;
-                margin: 0;
-            }
-
-            .message {
-                margin-bottom: 1.5rem;
-                padding: 1rem 1.25rem;
-                border-radius: var(--radius-lg);
-                max-width: 85%;
-                word-wrap: break-word;
-                animation: slideIn 0.3s ease-out;
-            }
-
-            @keyframes slideIn {
-                from {
-                    opacity: 0;
-                    transform: translateY(10px);
-                }
-                to {
-                    opacity: 1;
-                    transform: translateY(0);
-                }
-            }
-
-            .message-author {
-                font-size: 0.8rem;
-                font-weight: 600;
-                margin-bottom: 0.5rem;
-                color: var(--text-secondary);
-            }
-
-            .user-message .message-author {
-                color: rgba(255, 255, 255, 0.9);
-            }
-
-            .user-message {
-                background: linear-gradient(135deg, #3b82f6 0%, var(--primary-color) 100%); /* More subtle gradient */
-                color: white;
-                margin-left: auto;
-                border-bottom-right-radius: var(--radius-sm);
-                box-shadow: var(--shadow-md);
-            }
-
-            .ai-message {
-                background: #f1f5f9; /* Light gray to distinguish from the container */
-                color: var(--text-primary);
-                border-bottom-left-radius: var(--radius-sm);
-                box-shadow: var(--shadow-sm);
-                position: relative; /* For positioning the copy button */
-            }
-
-            .ai-message .message-author {
-                color: var(--primary-color);
-            }
-
-            .ai-message h1,
-            .ai-message h2,
-            .ai-message h3,
-            .ai-message h4,
-            .ai-message h5,
-            .ai-message h6 {
-                color: var(--primary-color);
-                margin-top: 0;
-                margin-bottom: 0.75rem;
-            }
-
-            .ai-message ul,
-            .ai-message ol {
-                padding-left: 1.5rem;
-                margin: 0.75rem 0;
-            }
-
-            .ai-message li {
-                margin-bottom: 0.5rem;
-            }
-
-            .ai-message strong {
-                color: var(--primary-color);
-            }
-
-            .ai-message p {
-                margin: 0.75rem 0;
-                line-height: 1.6;
-            }
-
-            .ai-message p:first-child {
-                margin-top: 0;
-            }
-
-            .ai-message p:last-child {
-                margin-bottom: 0;
-            }
-
-            .timestamp {
-                font-size: 0.75rem;
-                opacity: 0.7;
-                margin-top: 0.5rem;
-                font-style: italic;
-            }
-
-            .user-message .timestamp {
-                color: rgba(255, 255, 255, 0.8);
-                text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.2); /* Improves readability on gradient */
-            }
-
-            .copy-btn {
-                position: absolute;
-                top: 0.75rem;
-                right: 0.75rem;
-                background: var(--secondary-color);
-                border: 1px solid var(--border-color);
-                color: var(--text-secondary);
-                border-radius: var(--radius-sm);
-                cursor: pointer;
-                font-size: 0.9rem;
-                padding: 0.25rem 0.5rem;
-                opacity: 0; /* Hidden by default, appears on hover */
-                transition: opacity 0.2s ease, background-color 0.2s ease, color 0.2s ease;
-                line-height: 1;
-                z-index: 10;
-            }
-
-            .ai-message:hover .copy-btn {
-                opacity: 1; /* Show on hover of the message */
-            }
-
-            .copy-btn:hover {
-                background: #e2e8f0; /* Corresponds to btn-secondary:hover */
-                color: var(--text-primary);
-            }
-
-            .copy-btn.copied {
-                background-color: var(--accent-color);
-                border-color: var(--accent-color);
-                color: white;
-                opacity: 1;
-            }
-
-            .input-section {
-                display: flex;
-                gap: 1rem;
-                align-items: flex-start;
-            }
-
-            .input-wrapper {
-                flex: 1;
-            }
-
-            .input-wrapper textarea {
-                width: 100%;
-                padding: 1rem;
-                border: 2px solid var(--border-color);
-                border-radius: var(--radius-md);
-                font-family: inherit;
-                font-size: 1rem;
-                resize: vertical;
-                min-height: 80px;
-                background: white;
-                transition: border-color 0.2s ease, box-shadow 0.2s ease;
-            }
-
-            .input-wrapper textarea:focus {
-                outline: none;
-                border-color: var(--primary-color);
-                box-shadow: 0 0 0 3px rgba(37, 99, 235, 0.1);
-            }
-
-            .input-wrapper textarea::placeholder {
-                color: var(--text-muted);
-            }
-
-            .button-group {
-                display: flex;
-                flex-direction: column;
-                gap: 0.75rem;
-            }
-
-            .btn {
-                padding: 0.75rem 1.5rem;
-                border: none;
-                border-radius: var(--radius-md);
-                font-size: 1rem;
-                font-weight: 600;
-                cursor: pointer;
-                transition: all 0.2s ease;
-                text-decoration: none;
-                display: inline-flex;
-                align-items: center;
-                justify-content: center;
-                gap: 0.5rem;
-                min-width: 100px;
-            }
-
-            .btn-primary {
-                background: linear-gradient(135deg, var(--primary-color) 0%, var(--primary-dark) 100%);
-                color: white;
-                box-shadow: var(--shadow-sm);
-            }
-
-            .btn-primary:hover {
-                transform: translateY(-1px);
-                box-shadow: var(--shadow-md);
-            }
-
-            .btn-primary:active {
-                transform: translateY(0);
-            }
-
-            .btn-secondary {
-                background: #f1f5f9;
-                color: var(--text-secondary);
-                border: 1px solid var(--border-color);
-            }
-
-            .btn-secondary:hover {
-                background: #e2e8f0;
-                color: var(--text-primary);
-            }
-
-            .status-indicator {
-                margin-top: 1rem;
-                padding: 0.75rem 1rem;
-                border-radius: var(--radius-md);
-                font-size: 0.95rem;
-                font-weight: 500;
-                text-align: center;
-                transition: all 0.3s ease;
-            }
-
-            .status-ready {
-                background: #f0fdf4;
-                color: #166534;
-                border: 1px solid #bbf7d0;
-            }
-
-            .status-thinking {
-                background: #fef3c7;
-                color: #92400e;
-                border: 1px solid #fbbf24;
-            }
-
-            .status-error {
-                background: #fef2f2;
-                color: #dc2626;
-                border: 1px solid #fca5a5;
-            }
-
-            .app-footer {
-                text-align: center;
-                margin-top: 2rem;
-                padding-top: 1.5rem;
-                border-top: 1px solid var(--border-color);
-                color: var(--text-muted);
-                font-size: 0.9rem;
-            }
-
-            .divider {
-                height: 1px;
-                background: linear-gradient(to right, transparent, var(--border-color), transparent);
-                margin: 2rem 0;
-            }
-
-            /* Responsive Design */
-            @media (max-width: 768px) {
-                .main-container {
-                    padding: 1rem;
-                    margin: 1rem;
-                }
-                
-                .app-title {
-                    font-size: 2rem;
-                }
-                
-                .chat-container {
-                    max-height: 400px;
-                }
-                
-                .message {
-                    max-width: 95%;
-                }
-                
-                .input-section {
-                    flex-direction: column;
-                }
-                
-                .button-group {
-                    flex-direction: row;
-                    width: 100%;
-                }
-                
-                .btn {
-                    flex: 1;
-                }
-            }
-
-            /* Spinner Animation */
-            .typing-indicator {
-                display: inline-block;
-                margin-right: 0.5rem;
-                vertical-align: middle;
-            }
-            .typing-indicator span {
-                height: 8px;
-                width: 8px;
-                background-color: var(--text-secondary);
-                border-radius: 50%;
-                display: inline-block;
-                margin: 0 2px;
-                animation: typing-bounce 1.4s infinite both;
-            }
-            .typing-indicator span:nth-child(1) {
-                animation-delay: -0.32s;
-            }
-            .typing-indicator span:nth-child(2) {
-                animation-delay: -0.16s;
-            }
-            @keyframes typing-bounce {
-                0%, 80%, 100% {
-                    transform: scale(0);
-                } 40% {
-                    transform: scale(1.0);
-                }
-            }
-
-            /* Loading animation */
-            @keyframes pulse {
-                0%, 100% {
-                    opacity: 1;
-                }
-                50% {
-                    opacity: 0.5;
-                }
-            }
 
-            .loading {
-                animation: pulse 1.5s ease-in-out infinite;
-            }
-
-            /* Smooth transitions */
-            .fade-in {
-                animation: fadeIn 0.5s ease-out;
-            }
-
-            @keyframes fadeIn {
-                from {
-                    opacity: 0;
-                    transform: translateY(20px);
-                }
-                to {
-                    opacity: 1;
-                    transform: translateY(0);
-                }
-            }
-
-            /* Two-column Layout */
-            .content-wrapper {
-                display: flex;
-                gap: 2rem;
-                align-items: flex-start;
-                margin-top: 2rem;
-            }
-
-            .sidebar-column {
-                flex: 0 0 320px; /* Fixed width for the sidebar */
-                position: sticky; /* Make it stick on scroll */
-                top: 2rem;
-            }
-
-            .chat-column {
-                flex: 1; /* Take up remaining space */
-                min-width: 0; /* Prevent flexbox overflow */
-            }
-
-            /* Responsive stacking for smaller screens */
-            @media (max-width: 1024px) {
-                .content-wrapper {
-                    flex-direction: column;
-                }
-                .sidebar-column {
-                    position: static; /* Unstick it on smaller screens */
-                    width: 100%;
-                }
-            }
-        """),
-        ui.tags.script("""
-            // This function sets up all the interactive features on the page.
-            function initializeInteractions() {
-                const chatContainer = document.getElementById('chat-container');
-                const userInput = document.getElementById('user_input');
-                const sendButton = document.getElementById('send_message');
-
-                // --- Feature 1: Ctrl+Enter to send message ---
-                if (userInput && sendButton) {
-                    userInput.addEventListener('keydown', function(event) {
-                        if (event.key === 'Enter' && event.ctrlKey) {
-                            event.preventDefault(); // Prevent new line in textarea
-                            sendButton.click(); // Programmatically click the send button
-                        }
-                    });
-                }
-
-                // --- Feature 2: Copy to Clipboard for AI messages ---
-                if (chatContainer) {
-                    chatContainer.addEventListener('click', function(event) {
-                        const copyButton = event.target.closest('.copy-btn');
-                        if (copyButton) {
-                            const textToCopy = copyButton.getAttribute('data-copy-text');
-                            navigator.clipboard.writeText(textToCopy).then(() => {
-                                // Provide feedback to the user
-                                copyButton.classList.add('copied');
-                                copyButton.textContent = 'Copied!';
-                                setTimeout(() => {
-                                    copyButton.innerHTML = '&#128203;'; // Revert to icon
-                                    copyButton.classList.remove('copied');
-                                }, 2000);
-                            }).catch(err => {
-                                console.error('Failed to copy text: ', err);
-                            });
-                        }
-                    });
-                }
-            }
+# The clients are process-wide singletons: construction, configuration and the
+# underlying connection pools are paid once per worker at import time and shared
+# by every Shiny session instead of being rebuilt on each websocket connect.
+try:
+    HF_CLIENT = initialize_hf_client()
+    logger.info("[OK] Hugging Face Client initialized successfully")
+except Exception as e:
+    HF_CLIENT = None
+    logger.error(f"[ERR] Error initializing Hugging Face client: {e}")
+
+try:
+    GOOGLE_CLIENT = initialize_google_client()
+    logger.info("[OK] Google AI Client for translation initialized successfully")
+except Exception as e:
+    GOOGLE_CLIENT = None
+    logger.error(f"[ERR] Error initializing Google AI client: {e}")
+
+# Messages get a process-unique id at creation; caches and DOM ids key on it
+# instead of re-hashing content on every lookup
+_msg_counter = itertools.count()
+
+# Chat bubble class strings, named once so readers see they are fixed
+USER_MSG_CLS = "message user-message"
+AI_MSG_CLS = "message ai-message"
+TS_CLS = "timestamp"
+
+
+@functools.lru_cache(maxsize=512)
+def _md(content: str) -> ui.Tag:
+    """Parse markdown once per unique content string.
+
+    AI messages are immutable once stored, and the resulting Tag is immutable
+    too, so caching by content is safe. Unlike the per-session bubble cache,
+    this survives clears and is shared across sessions, so identical answers
+    (e.g. cache hits on common questions) never re-parse.
+    """
+    return ui.markdown(content)
+
+
+def build_message_div(msg: dict) -> ui.Tag:
+    """Build the chat bubble for one history entry (user or AI)."""
+    if msg["type"] == "user":
+        return ui.div(
+            ui.div("You", class_="message-author"),
+            ui.div(msg["content"]),
+            ui.div(msg["timestamp"], class_=TS_CLS),
+            class_=USER_MSG_CLS,
+            id=f"msg-{msg['id']}"
+        )
+    return ui.div(
+        # Add a copy button that the JS in app.js will use
+        ui.div("AI Assistant", class_="message-author"),
+        ui.tags.button(
+            "📋",
+            class_="copy-btn",
+            title="Copy response to clipboard",
+            **{"data-copy-text": msg["content"]},
+        ),
+        _md(msg["content"]),
+        ui.div(msg["timestamp"], class_=TS_CLS),
+        class_=AI_MSG_CLS,
+        id=f"msg-{msg['id']}"
+    )
 
-            // --- Auto-scrolling logic (from your original script) ---
-            function scrollChatToBottom() {
-                const chatContainer = document.getElementById('chat-container');
-                if (chatContainer) {
-                    setTimeout(() => { chatContainer.scrollTop = chatContainer.scrollHeight; }, 100);
-                }
-            }
 
-            // Initialize everything when the document is ready.
-            document.addEventListener('DOMContentLoaded', function() {
-                initializeInteractions();
-                const observer = new MutationObserver(scrollChatToBottom);
-                const chatContainer = document.getElementById('chat-container');
-                if (chatContainer) {
-                    observer.observe(chatContainer, { childList: true, subtree: true });
-                }
-            });
-        """)
+# UI Definition
+app_ui = ui.page_fluid(
+    # CSS and JS live in the 'www' directory so browsers can cache them across
+    # reloads instead of re-downloading ~17 KB of inline blocks per page render
+    ui.tags.head(
+        ui.tags.link(rel="stylesheet", href="app.css"),
+        ui.tags.script(src="app.js")
     ),
     ui.div(
         # Header section from the new stylesheet
@@ -707,174 +505,488 @@ app_ui = ui.page_fluid(
 
 # Server Logic
 def server(input, output, session):
-    # Initialize clients
-    try:
-        hf_client = initialize_hf_client()
-        print("✅ Hugging Face Client initialized successfully")
-    except Exception as e:
-        hf_client = None
-        print(f"❌ Error initializing Hugging Face client: {e}")
-
-    try:
-        google_client = initialize_google_client()
-        print("✅ Google AI Client for translation initialized successfully")
-    except Exception as e:
-        google_client = None
-        print(f"❌ Error initializing Google AI client: {e}")
+    # Bind the shared, process-wide clients
+    hf_client = HF_CLIENT
+    google_client = GOOGLE_CLIENT
+
+    # One Gemini chat per user session: translation prompts share the primer as
+    # a stable prefix, so Gemini's server-side prompt cache stays hot.
+    translate_chat = None
+    if google_client:
+        translate_chat = google_client.start_chat(history=[
+            {"role": "user", "parts": [TRANSLATE_PRIMER]},
+            {"role": "model", "parts": ["Understood."]},
+        ])
+
+    async def send_via_translate_chat(prompt: str):
+        """Send one translation prompt through the primed chat session.
+
+        The session only exists to keep the primer prefix stable for Gemini's
+        prompt cache; past translations add nothing, so the history is trimmed
+        back to the two primer entries after every send to keep each request's
+        payload (and token bill) constant.
+        """
+        try:
+            return await translate_chat.send_message_async(prompt)
+        finally:
+            del translate_chat.history[2:]
     
     # Reactive values for chat history
     chat_history = reactive.Value([])
     is_processing = reactive.Value(False)
+    # Bumped on clear: the only event that forces a full chat re-render.
+    # New messages are appended client-side instead of re-rendering everything.
+    chat_reset = reactive.Value(0)
+    # Last confidently detected language for this session ("sticky language")
+    session_lang = reactive.Value(None)
+    # Rolling English summary of conversation turns older than the context window
+    rolling_summary = reactive.Value("")
+    # Monotonic count of messages this session has produced; the summary refresh
+    # keys on this, not on len(chat_history), which pins at MAX_HISTORY_MESSAGES
+    messages_seen = 0
+    # Strong references to fire-and-forget tasks: the event loop only keeps
+    # weak ones, so an unreferenced summary refresh could be collected mid-flight
+    background_tasks = set()
+    # Built message nodes keyed by the message's stable id: content is immutable
+    # once stored, so each bubble pays its markdown parse exactly once and cache
+    # lookups are O(1) integer compares rather than content hashes
+    rendered_cache = {}
+
+    def cached_message_div(msg: dict) -> ui.Tag:
+        node = rendered_cache.get(msg["id"])
+        if node is None:
+            node = rendered_cache[msg["id"]] = build_message_div(msg)
+        return node
     
-    def detect_language(text: str, client: genai.GenerativeModel) -> str:
-        """Detects the language of the given text using Google's Gemini model."""
+    def detect_language(text: str):
+        """Detects the language of the given text locally; returns None when unsure.
+
+        There is deliberately no remote fallback here: when the local detector and
+        the sticky session language both come up empty, the post-generation
+        translation prompt auto-detects the target from the user's own message,
+        so a dedicated detection round-trip would be a wasted call.
+        """
+        # Repeated or near-identical inputs reuse the previous detection result
+        cache_key = detect_cache_key(text)
+        cached_lang = detect_cache.get(cache_key)
+        if cached_lang is not None:
+            return cached_lang
+
+        # Fast path: in-process detection costs well under a millisecond and
+        # removes a full API round-trip from every user turn.
+        local_lang = local_language_of(text)
+        if local_lang is not None:
+            logger.info(f"[OK] Language detected locally: {local_lang}")
+            detect_cache.set(cache_key, local_lang)
+            session_lang.set(local_lang)
+            return local_lang
+
+        # Low confidence (typically short follow-ups): stick with the language
+        # already established for this session. Isolated because this also runs
+        # inside the generation task, outside any reactive context.
+        with reactive.isolate():
+            sticky_lang = session_lang.get()
+        if sticky_lang is not None:
+            logger.info(f"[OK] Using sticky session language: {sticky_lang}")
+            return sticky_lang
+
+        logger.warning("[WARN] Language unknown; the translation step will auto-detect if needed.")
+        return None
+
+    async def translate_to_match(text: str, user_message_sample: str, client: genai.GenerativeModel):
+        """Translate text into the language of the user's own message in one fused call.
+
+        Returns None when the translation could not be performed, so the caller
+        can decide how to present the original text and whether to cache it.
+        """
         if not client:
-            print("⚠️ Language detection skipped: Google AI client not initialized.")
-            return "English"  # Default to English if client is not available
+            return None
 
-        print(f"🔎 Detecting language for: {text[:50]}...")
+        logger.info("[RUN] Translating response to match the user's language...")
         try:
-            prompt = f"What language is the following text written in? Respond with only the language name (e.g., 'Indonesian', 'English', 'Spanish').\n\nText: \"{text}\""
-            response = client.generate_content(prompt)
-            detected_lang = response.text.strip()
-            # Handle cases where the model might be verbose
-            if '\n' in detected_lang:
-                detected_lang = detected_lang.split('\n')[0]
-            print(f"✅ Language detected: {detected_lang}")
-            return detected_lang
+            prompt = MATCH_PROMPT_FMT.format(sample=user_message_sample[:300], text=text)
+            if translate_chat is not None:
+                response = await send_via_translate_chat(prompt)
+            else:
+                response = await client.generate_content_async(prompt)
+            logger.info("[OK] Translation successful.")
+            return response.text
         except Exception as e:
-            print(f"❌ Exception during language detection: {e!r}. Defaulting to English.")
-            return "English"
+            logger.error(f"[ERR] Exception during auto-detect translation: {e!r}")
+            return None
+
+    async def translate_text(text: str, target_language: str, client: genai.GenerativeModel):
+        """Translates text to the target language using Google's Gemini model.
+
+        Returns None when the translation could not be performed, so the caller
+        can decide how to present the original text and whether to cache it.
+        """
+        # Empty, error, or trivially short ASCII strings are not worth a round-trip
+        if not text or text.startswith("Error:") or text.startswith("An error occurred"):
+            return text
+        if len(text) < 20 and text.isascii():
+            return text
 
-    def translate_text(text: str, target_language: str, client: genai.GenerativeModel) -> str:
-        """Translates text to the target language using Google's Gemini model."""
         if not client:
-            return f"(Translation failed: Google AI client not initialized) {text}"
+            logger.warning("[WARN] Translation skipped: Google AI client not initialized.")
+            return None
+
+        # The model is asked to answer in the user's language, so the text often
+        # already matches the target; a sub-millisecond local check then saves
+        # the whole Gemini round-trip.
+        text_lang = local_language_of(text)
+        if text_lang is not None and text_lang.lower() == target_language.lower():
+            logger.info(f"[OK] No translation needed (text already in {target_language}).")
+            return text
 
-        # No need to translate if the text is already in the target language
-        if target_language.lower() == 'english':
-            print("✅ No translation needed (target is English).")
+        # The model defaults to English, so when the local detector can't tell
+        # what the text is, an English target is the one case safe to skip.
+        # A confident non-English detection still goes through translation:
+        # e.g. a cached Indonesian answer being replayed to an English speaker.
+        if text_lang is None and target_language.lower() == 'english':
+            logger.info("[OK] No translation needed (target is English).")
             return text
 
-        print(f"🔄 Translating response to {target_language}...")
+        # Long multi-paragraph answers are split and translated concurrently, so
+        # wall time is roughly one chunk's latency instead of the whole text's.
+        # These chunks bypass the shared chat session: concurrent sends would
+        # interleave its history, and stateless calls are safe to gather.
+        paragraphs = text.split("\n\n")
+        if len(paragraphs) > 3:
+            logger.info(f"[RUN] Translating {len(paragraphs)} paragraphs to {target_language} in parallel...")
+            try:
+                async def translate_paragraph(paragraph: str) -> str:
+                    if not paragraph.strip():
+                        return paragraph
+                    response = await client.generate_content_async(
+                        TRANSLATE_PROMPT_FMT.format(target=target_language, text=paragraph)
+                    )
+                    return response.text.strip("\n")
+
+                translated = await asyncio.gather(*(translate_paragraph(p) for p in paragraphs))
+                logger.info("[OK] Translation successful.")
+                return "\n\n".join(translated)
+            except Exception as e:
+                logger.error(f"[ERR] Exception during parallel translation to {target_language}: {e!r}")
+                return None
+
+        logger.info(f"[RUN] Translating response to {target_language}...")
         try:
-            prompt = f"Translate the following English text to {target_language}. Only provide the translation, nothing else:\n\n{text}"
-            response = client.generate_content(prompt)
-            print("✅ Translation successful.")
+            prompt = TRANSLATE_PROMPT_FMT.format(target=target_language, text=text)
+            if translate_chat is not None:
+                response = await send_via_translate_chat(prompt)
+            else:
+                response = await client.generate_content_async(prompt)
+            logger.info("[OK] Translation successful.")
             return response.text
         except Exception as e:
-            print(f"❌ Exception during translation to {target_language}: {e!r}")
-            return f"(Translation to {target_language} failed, showing original text) {text}"
+            logger.error(f"[ERR] Exception during translation to {target_language}: {e!r}")
+            return None
+
+    async def update_rolling_summary(older_messages: list) -> None:
+        """Refresh the rolling conversation summary in the background."""
+        try:
+            transcript = "\n".join(
+                f"{'User' if msg['type'] == 'user' else 'Assistant'}: {msg['content']}"
+                for msg in older_messages
+            )
+            response = await google_client.generate_content_async(
+                SUMMARY_PROMPT_FMT.format(transcript=transcript)
+            )
+            async with reactive.lock():
+                rolling_summary.set(response.text.strip())
+                await reactive.flush()
+            logger.info("[OK] Rolling conversation summary refreshed")
+        except Exception as e:
+            logger.error(f"[ERR] Exception during summary refresh: {e!r}")
+
+    async def get_ai_response(user_message: str) -> str:
+        """Get a response from the medical AI model in the user's own language."""
+        logger.info(f"[RUN] Getting AI response for: {user_message[:50]}...")
 
-    def get_ai_response(user_message: str) -> str:
-        """Get response from the medical AI model and translate it to the user's language."""
-        print(f"🔄 Getting AI response for: {user_message[:50]}...")
-        
         if not hf_client:
-            print("❌ Hugging Face client not initialized!")
+            logger.error("[ERR] Hugging Face client not initialized!")
             return "Error: AI client not initialized. Please check your API key configuration."
-        
-        # 1. Detect the language of the user's input
-        user_lang = detect_language(user_message, google_client)
-        
+
+        # 0. Trivial greetings skip all three API calls entirely
+        if len(user_message) < 10 and GREETING_RE.match(user_message.lower()):
+            logger.info("[OK] Greeting detected, returning canned response")
+            return CANNED_GREETING
+
+        # Conversation context: the last few messages verbatim plus the rolling
+        # summary of everything older. Both the cache key and the model messages
+        # use it, so a repeated question only hits the cache in the same context.
+        # Isolated because this runs inside the generation task, outside any
+        # reactive context.
+        with reactive.isolate():
+            history = chat_history.get()
+            summary = rolling_summary.get()
+        context_msgs = []
+        if summary:
+            context_msgs.append({
+                "role": "assistant",
+                "content": f"Summary of the earlier conversation: {summary}"
+            })
+        context_msgs.extend(
+            {"role": "user" if msg["type"] == "user" else "assistant", "content": msg["content"]}
+            for msg in history[-HISTORY_CONTEXT_TURNS:]
+        )
+
+        # 1. Detect the user's language locally (no network involved); it is
+        # injected into the system prompt so the model answers natively, which
+        # normally makes the post-generation translation round-trip unnecessary.
+        user_lang = detect_language(user_message)
+
+        # 1a. Identical questions skip the whole pipeline via the exact-match
+        # cache. The resolved language is part of the key: detection falls back
+        # to the sticky session language, so the same short message can resolve
+        # differently per session and must not share a cached answer.
+        cache_key = response_cache_key(
+            user_message, tuple(m["content"] for m in context_msgs), user_lang
+        )
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info(f"[OK] Response cache hit ({response_cache.stats['hits']} hits, {response_cache.stats['misses']} misses)")
+            return cached_response
+
+        # 1b. Paraphrased repeats of past questions are served from the semantic
+        # cache. The current message is not in the history yet, so the last
+        # stored user entry is the previous turn.
+        prev_user_message = next(
+            (msg["content"] for msg in reversed(history) if msg["type"] == "user"), None
+        )
+        semantic_hit = semantic_cache.lookup(user_message, prev_user_message)
+        if semantic_hit is not None:
+            cached_response, cached_lang = semantic_hit
+            logger.info("[OK] Semantic cache hit, skipping HF generation")
+            if user_lang is None:
+                translated = await translate_to_match(cached_response, user_message, google_client)
+                return translated if translated is not None else cached_response
+            if cached_lang.lower() == user_lang.lower():
+                return cached_response
+            translated = await translate_text(cached_response, user_lang, google_client)
+            if translated is None:
+                return f"(Translation to {user_lang} failed, showing original text) {cached_response}"
+            return translated
+
         response_content = ""
+        success = False
         try:
-            # Create messages for the API
-            messages = [
-                {
-                    "role": "system",
-                    "content": "You are Dokter Arki, a helpful medical AI assistant. Provide accurate, educational information. Structure your answer for clarity and readability. Use markdown formatting such as bullet points (`* item`), numbered lists, and bold text (`**text**`) where it helps to explain complex information. Always conclude your response by reminding the user to consult a qualified healthcare professional for any medical advice, diagnosis, or treatment."
-                },
-                {"role": "user", "content": user_message},
-            ]
-            
-            print("📡 Sending request to Hugging Face API...")
-            completion = hf_client.chat.completions.create(
-                model="Intelligent-Internet/II-Medical-8B-1706", messages=messages, max_tokens=1000, temperature=0.7
+            # Create messages for the API; English turns reuse the prebuilt system message
+            if user_lang is not None and user_lang.lower() != "english":
+                system_msg = {"role": "system", "content": f"{SYSTEM_PROMPT} Respond in {user_lang}."}
+            else:
+                system_msg = _SYSTEM_MSG
+            messages = [system_msg, *context_msgs, {"role": "user", "content": user_message}]
+
+            # Stream tokens into the chat as they arrive, so the user sees the
+            # answer forming after ~300ms instead of staring at a spinner until
+            # the full generation finishes.
+            last_push = 0.0
+
+            async def on_delta(partial: str):
+                nonlocal last_push
+                now = time.monotonic()
+                if now - last_push < STREAM_UPDATE_INTERVAL:
+                    return
+                last_push = now
+                await session.send_custom_message("stream_msg", {"text": partial})
+
+            # Generation time scales with the token budget, so short questions get
+            # a smaller cap instead of always reserving room for a long essay.
+            word_count = len(user_message.split())
+            dyn_max_tokens = max(256, min(1000, 200 + 2 * word_count))
+
+            logger.info(f"[API] Sending request to Hugging Face API (max_tokens={dyn_max_tokens})...")
+            response_content = await completion_batcher.submit(
+                hf_client, messages, on_delta,
+                max_tokens=dyn_max_tokens, temperature=0.7, stop=["\n\n---", "</answer>"]
             )
-            
-            if completion.choices:
-                response_content = completion.choices[0].message.content
-                print(f"✅ Received English response: {response_content[:100]}...")
+
+            if response_content:
+                success = True
+                logger.info(f"[OK] Received streamed response: {response_content[:100]}...")
             else:
                 response_content = "The AI model returned an empty response. Please try rephrasing your question or try again later."
-                print("⚠️ API call successful, but the model returned no choices.")
-            
-        except StopIteration:
+                logger.warning("[WARN] API call successful, but the model streamed no content.")
+
+        except StopAsyncIteration:
             # This can happen if the model fails to generate any output and the client library doesn't handle it gracefully.
             response_content = "The AI model did not generate a response. This might be a temporary issue with the service. Please try again."
-            print("❌ StopIteration caught during API call. The model likely produced no output.")
+            logger.error("[ERR] StopAsyncIteration caught during API call. The model likely produced no output.")
         except Exception as e:
-            print(f"❌ Exception during API call: {e!r}")
+            logger.error(f"[ERR] Exception during API call: {e!r}")
             # For user-facing errors, it's better to be generic.
             response_content = "An error occurred while communicating with the AI. Please try again later."
 
-        # 2. Translate the final response content (whether it's a success or an error message)
-        return translate_text(response_content, user_lang, google_client)
-    
+        # Error strings are shown as-is: spending another API call on text the
+        # pipeline already failed to produce properly would just add latency.
+        if not success:
+            return response_content
+
+        # 2. Fall back to Gemini translation only when the reply's language
+        # disagrees with the user's language. When the user's language is
+        # unknown, one fused call auto-detects it from their message.
+        translation_failed = False
+        if user_lang is None:
+            translated = await translate_to_match(response_content, user_message, google_client)
+            if translated is None:
+                translation_failed = True
+            else:
+                response_content = translated
+                user_lang = local_language_of(response_content) or "English"
+        else:
+            response_lang = local_language_of(response_content) if response_content else user_lang
+            if response_lang is None or response_lang.lower() != user_lang.lower():
+                translated = await translate_text(response_content, user_lang, google_client)
+                if translated is None:
+                    translation_failed = True
+                    response_content = f"(Translation to {user_lang} failed, showing original text) {response_content}"
+                else:
+                    response_content = translated
+
+        # A failure banner (or an answer in the wrong language) must not be
+        # served to later questions, so only fully translated answers are cached.
+        if translation_failed:
+            return response_content
+        response_cache.set(cache_key, response_content)
+        semantic_cache.add(user_message, response_content, user_lang, prev_user_message)
+        return response_content
+
+    # The user message whose generation is currently in flight; lets the
+    # completion effect commit the right turn even when the task errors out.
+    pending_user_msg = None
+
+    # Generation runs as an extended task: the send effect returns as soon as
+    # the task is launched, which releases the global reactive lock, so this
+    # and other sessions keep servicing inputs (clear, typing, further sends)
+    # while tokens stream in.
+    @reactive.extended_task
+    async def ai_generation(user_message: str) -> str:
+        return await get_ai_response(user_message)
+
     @reactive.Effect
     @reactive.event(input.send_message)
-    def handle_send_message():
-        print("🎯 Send message triggered")
-        
+    async def handle_send_message():
+        nonlocal pending_user_msg
+        logger.info("[SEND] Send message triggered")
+
         try:
             user_message = input.user_input().strip()
-            print(f"📝 User message: {user_message}")
-            
+            logger.info(f"[MSG] User message: {user_message}")
+
             if not user_message:
-                print("⚠️ No user message provided.")
+                logger.warning("[WARN] No user message provided.")
                 return
-            
+
+            if ai_generation.status() == "running":
+                logger.warning("[WARN] A generation is already in flight; ignoring send.")
+                return
+
             # Clear input immediately
             ui.update_text_area("user_input", value="")
-            
-            # Add user message to chat history
-            current_history = chat_history.get()
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            
-            # Add user message
-            updated_history = current_history + [{
+
+            user_msg = {
+                "id": next(_msg_counter),
                 "type": "user",
                 "content": user_message,
-                "timestamp": timestamp
-            }]
-            
-            chat_history.set(updated_history)
-            print("📝 Added user message to history")
-            
-            # Set processing state
+                "timestamp": time.strftime(TS_FMT)
+            }
+
+            # Append only the new message client-side: per-turn render work stays
+            # O(1) instead of re-serializing the whole conversation.
+            await session.send_custom_message("append_msg", {
+                "html": str(cached_message_div(user_msg))
+            })
+
+            pending_user_msg = user_msg
             is_processing.set(True)
-            
-            # Get AI response (synchronous)
-            ai_response = get_ai_response(user_message)
-            
-            # Add AI response to chat history
-            final_history = updated_history + [{
+            ai_generation(user_message)
+
+        except Exception as e:
+            logger.error(f"[ERR] Exception in handle_send_message: {e}")
+            is_processing.set(False)
+
+    @reactive.Effect
+    @reactive.event(ai_generation.status)
+    async def handle_generation_done():
+        nonlocal messages_seen, pending_user_msg
+        if ai_generation.status() not in ("success", "error"):
+            return
+        user_msg, pending_user_msg = pending_user_msg, None
+        if user_msg is None:
+            return
+
+        try:
+            try:
+                ai_response = ai_generation.result()
+            except Exception as e:
+                logger.error(f"[ERR] Exception in generation task: {e!r}")
+                ai_response = "An error occurred while communicating with the AI. Please try again later."
+
+            ai_msg = {
+                "id": next(_msg_counter),
                 "type": "ai",
                 "content": ai_response,
-                "timestamp": datetime.now().strftime("%H:%M:%S")
-            }]
-            
+                "timestamp": time.strftime(TS_FMT)
+            }
+
+            # Commit both messages with a single windowed copy per turn; the HF
+            # request carries only the rolling summary plus the last few
+            # messages, so the API payload stays bounded regardless of length.
+            current_history = chat_history.get()
+            final_history = (current_history + [user_msg, ai_msg])[-MAX_HISTORY_MESSAGES:]
             chat_history.set(final_history)
+
+            # Drop rendered bubbles for messages the window just evicted, so the
+            # cache tracks the visible history instead of growing for the whole
+            # session.
+            live_ids = {msg["id"] for msg in final_history}
+            for stale_id in [cached_id for cached_id in rendered_cache if cached_id not in live_ids]:
+                del rendered_cache[stale_id]
+
+            await session.send_custom_message("append_msg", {
+                "html": str(cached_message_div(ai_msg))
+            })
             is_processing.set(False)
-            
-            print("✅ Message handling completed successfully")
-            
+
+            # Periodically fold turns older than the context window into the
+            # rolling summary; runs in the background so the turn isn't delayed.
+            messages_seen += 2
+            if (google_client and len(final_history) > HISTORY_CONTEXT_TURNS
+                    and messages_seen % SUMMARY_PERIOD == 0):
+                task = asyncio.create_task(
+                    update_rolling_summary(final_history[:-HISTORY_CONTEXT_TURNS])
+                )
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+
+            logger.info("[OK] Message handling completed successfully")
+
         except Exception as e:
-            print(f"❌ Exception in handle_send_message: {e}")
+            logger.error(f"[ERR] Exception in handle_generation_done: {e}")
             is_processing.set(False)
     
     @reactive.Effect
     @reactive.event(input.clear_chat)
     def handle_clear_chat():
-        print("🗑️ Clearing chat history")
+        nonlocal messages_seen
+        logger.info("[CLEAR] Clearing chat history")
         chat_history.set([])
+        rolling_summary.set("")
+        messages_seen = 0
+        rendered_cache.clear()
+        chat_reset.set(chat_reset.get() + 1)
     
     @output
     @render.ui
     def render_chat_history():
-        history = chat_history.get()
-        
+        # Full render happens only on initial paint and on clear; during a
+        # conversation, new messages arrive via the append_msg custom message.
+        chat_reset.get()
+        with reactive.isolate():
+            history = chat_history.get()
+
         if not history:
             # Use the new, more engaging welcome message style
             return ui.div(
@@ -886,36 +998,7 @@ def server(input, output, session):
                 class_="chat-welcome"
             )
         
-        messages = []
-        for i, msg in enumerate(history):
-            if msg["type"] == "user":
-                messages.append(
-                    ui.div(
-                        ui.div("You", class_="message-author"),
-                        ui.div(msg["content"]),
-                        ui.div(msg["timestamp"], class_="timestamp"),
-                        class_="message user-message",
-                        id=f"msg-{i}"
-                    )
-                )
-            else:
-                messages.append(
-                    ui.div(
-                        # Add a copy button that the JS in main.js will use
-                        ui.div("AI Assistant", class_="message-author"),
-                        ui.tags.button(
-                            "📋",
-                            class_="copy-btn",
-                            title="Copy response to clipboard",
-                            **{"data-copy-text": msg["content"]},
-                        ),
-                        ui.markdown(msg["content"]),
-                        ui.div(msg["timestamp"], class_="timestamp"),
-                        class_="message ai-message",
-                        id=f"msg-{i}"
-                    )
-                )
-        
+        messages = [cached_message_div(msg) for msg in history]
         return ui.div(*messages)
     
     @output
@@ -945,9 +1028,9 @@ def server(input, output, session):
 
 
 # Create the app
-app = App(app_ui, server)
+app = App(app_ui, server, static_assets=Path(__file__).parent / "www")
 
 # This block is essential for running the app locally using `python app.py`.
 if __name__ == "__main__":
-    print("🚀 Starting Medical Chatbot...")
+    logger.info("[START] Starting Medical Chatbot...")
     app.run()
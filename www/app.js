@@ -0,0 +1,92 @@
+// This function sets up all the interactive features on the page.
+// Both handlers are delegated to `document` and registered exactly once, so
+// they survive Shiny swapping out the textarea, buttons, or chat DOM on
+// reactive re-renders, and the listener count stays flat regardless of how
+// many messages accumulate.
+function initializeInteractions() {
+    // --- Feature 1: Ctrl+Enter to send message ---
+    document.addEventListener('keydown', function(event) {
+        if (event.ctrlKey && event.key === 'Enter' && event.target.id === 'user_input') {
+            event.preventDefault(); // Prevent new line in textarea
+            document.getElementById('send_message')?.click();
+        }
+    });
+
+    // --- Feature 2: Copy to Clipboard for AI messages ---
+    document.addEventListener('click', function(event) {
+        const copyButton = event.target.closest('.copy-btn');
+        if (copyButton) {
+            const textToCopy = copyButton.getAttribute('data-copy-text');
+            navigator.clipboard.writeText(textToCopy).then(() => {
+                // Provide feedback to the user
+                copyButton.classList.add('copied');
+                copyButton.textContent = 'Copied!';
+                setTimeout(() => {
+                    copyButton.innerHTML = '&#128203;'; // Revert to icon
+                    copyButton.classList.remove('copied');
+                }, 2000);
+            }).catch(err => {
+                console.error('Failed to copy text: ', err);
+            });
+        }
+    });
+}
+
+// --- Incremental chat updates pushed from the server ---
+// Appending only the new message keeps per-turn DOM work constant instead of
+// re-rendering the whole conversation.
+function registerChatHandlers() {
+    if (!window.Shiny) return;
+
+    const outputContainer = () => document.getElementById('render_chat_history');
+
+    // Scroll once per animation frame at most; per-token scrolling during
+    // streaming would force a layout reflow on every DOM update.
+    let pendingScroll = false;
+    function scrollToBottom() {
+        if (pendingScroll) return;
+        pendingScroll = true;
+        requestAnimationFrame(() => {
+            const chatContainer = document.getElementById('chat-container');
+            if (chatContainer) {
+                chatContainer.scrollTop = chatContainer.scrollHeight;
+            }
+            pendingScroll = false;
+        });
+    }
+
+    // A finalized message (user or AI) appended to the conversation.
+    Shiny.addCustomMessageHandler('append_msg', function(msg) {
+        const container = outputContainer();
+        if (!container) return;
+        // Drop the welcome placeholder and any in-flight streaming bubble.
+        container.querySelector('.chat-welcome')?.remove();
+        document.getElementById('msg-streaming')?.remove();
+        container.insertAdjacentHTML('beforeend', msg.html);
+        scrollToBottom();
+    });
+
+    // Partial AI response while tokens are still streaming in.
+    Shiny.addCustomMessageHandler('stream_msg', function(msg) {
+        const container = outputContainer();
+        if (!container) return;
+        let streamEl = document.getElementById('msg-streaming');
+        if (!streamEl) {
+            container.insertAdjacentHTML(
+                'beforeend',
+                '<div class="message ai-message" id="msg-streaming">' +
+                '<div class="message-author">AI Assistant</div>' +
+                '<div class="stream-body"></div></div>'
+            );
+            streamEl = document.getElementById('msg-streaming');
+        }
+        streamEl.querySelector('.stream-body').textContent = msg.text;
+        scrollToBottom();
+    });
+}
+
+// Initialize everything when the document is ready.
+document.addEventListener('DOMContentLoaded', function() {
+    initializeInteractions();
+    registerChatHandlers();
+});